@@ -1,6 +1,8 @@
 import os
 import csv
 import argparse
+import itertools
+import multiprocessing
 import sys
 
 def parse_arguments():
@@ -53,23 +55,27 @@ def process_csv_file(input_path: str, output_path: str):
     """
     try:
         with open(input_path, 'r', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile)
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
             
             # Check for required columns
-            if 'Timecode' not in reader.fieldnames or 'Content_zh' not in reader.fieldnames:
+            if header is None or 'Timecode' not in header or 'Content_zh' not in header:
                 print(f"Warning: 'Timecode' or 'Content_zh' column not found in '{input_path}'. Skipping file.")
                 return
+            timecode_index = header.index('Timecode')
+            content_index = header.index('Content_zh')
             
-            rows = list(reader)
-        
-        if not rows:
-            print(f"Warning: No data found in '{input_path}'. Skipping file.")
-            return
-        
-        with open(output_path, 'w', encoding='utf-8') as srtfile:
-            for idx, row in enumerate(rows, start=1):
-                timecode = row['Timecode'].strip()
-                content = row['Content_zh'].strip()
+            rows = (row for row in reader if row)  # Skip blank lines like csv.DictReader
+            first_row = next(rows, None)
+            if first_row is None:
+                print(f"Warning: No data found in '{input_path}'. Skipping file.")
+                return
+            
+            blocks = []
+            for idx, row in enumerate(itertools.chain([first_row], rows), start=1):
+                row.extend([''] * (len(header) - len(row)))  # Treat missing trailing fields as empty
+                timecode = row[timecode_index].strip()
+                content = row[content_index].strip()
                 
                 # Skip empty subtitles
                 if not timecode or not content:
@@ -79,10 +85,12 @@ def process_csv_file(input_path: str, output_path: str):
                 # Sanitize content
                 content = sanitize_content(content)
                 
-                # Write to SRT format
-                srtfile.write(f"{idx}\n")
-                srtfile.write(f"{timecode}\n")
-                srtfile.write(f"{content}\n\n")
+                # Collect the block in SRT format
+                blocks.append(f"{idx}\n{timecode}\n{content}\n\n")
+        
+        # Write all blocks with a single call
+        with open(output_path, 'w', encoding='utf-8') as srtfile:
+            srtfile.write(''.join(blocks))
         
         print(f"Successfully created SRT file: '{os.path.basename(output_path)}'")
     
@@ -91,7 +99,7 @@ def process_csv_file(input_path: str, output_path: str):
 
 def convert_all_csv_to_srt(input_directory: str, output_directory: str):
     """
-    Converts all CSV files in the input directory to SRT files in the output directory.
+    Converts all CSV files in the input directory to SRT files in the output directory in parallel.
 
     Parameters:
         input_directory (str): Directory containing input CSV files.
@@ -101,12 +109,13 @@ def convert_all_csv_to_srt(input_directory: str, output_directory: str):
     os.makedirs(output_directory, exist_ok=True)
 
     # List all CSV files in the input directory
-    csv_files = [f for f in os.listdir(input_directory) if f.lower().endswith('.csv')]
+    csv_files = [entry.name for entry in os.scandir(input_directory) if entry.is_file() and entry.name.lower().endswith('.csv')]
     
     if not csv_files:
         print(f"No CSV files found in the '{input_directory}' folder.")
         return
     
+    jobs = []
     for csv_file in csv_files:
         input_file_path = os.path.join(input_directory, csv_file)
         base_name, _ = os.path.splitext(csv_file)
@@ -114,7 +123,11 @@ def convert_all_csv_to_srt(input_directory: str, output_directory: str):
         output_file_path = os.path.join(output_directory, output_file_name)
         
         print(f"Converting '{csv_file}' to '{output_file_name}'...")
-        process_csv_file(input_file_path, output_file_path)
+        jobs.append((input_file_path, output_file_path))
+    
+    # Each file is independent, so convert them on all available cores
+    with multiprocessing.Pool(min(multiprocessing.cpu_count(), len(jobs))) as pool:
+        pool.starmap(process_csv_file, jobs, chunksize=1)
 
 def main():
     args = parse_arguments()
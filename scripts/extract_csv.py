@@ -1,9 +1,9 @@
 import os
-import re
 import argparse
 import csv
+import multiprocessing
 import sys
-from datetime import datetime
+from srt_format import iter_srt_blocks
 
 def parse_arguments():
     """
@@ -34,20 +34,19 @@ def parse_arguments():
 
 def parse_time(time_str):
     """
-    Parses a time string from SRT format to a datetime object.
-    Example: "00:01:15,123" -> datetime object
+    Parses a time string from SRT format to an integer number of milliseconds.
+    Example: "00:01:15,123" -> 75123
     """
-    try:
-        return datetime.strptime(time_str, "%H:%M:%S,%f")
-    except ValueError as e:
-        print(f"Error parsing time '{time_str}': {e}")
-        return None
+    return (int(time_str[0:2]) * 3600000 + int(time_str[3:5]) * 60000
+            + int(time_str[6:8]) * 1000 + int(time_str[9:12]))
 
 class Subtitle:
+    __slots__ = ('number', 'start', 'end', 'text')
+
     def __init__(self, number, start, end, text):
         self.number = number  # int
-        self.start = start    # datetime
-        self.end = end        # datetime
+        self.start = start    # int, milliseconds
+        self.end = end        # int, milliseconds
         self.text = text      # list of strings
     
     def timecode(self):
@@ -57,12 +56,15 @@ class Subtitle:
         """
         return f"{format_time(self.start)} --> {format_time(self.end)}"
 
-def format_time(time_obj):
+def format_time(milliseconds):
     """
-    Formats a datetime object to SRT time string.
-    Example: datetime object -> "00:01:15,123"
+    Formats an integer number of milliseconds to SRT time string.
+    Example: 75123 -> "00:01:15,123"
     """
-    return time_obj.strftime("%H:%M:%S,%f")[:-3]
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
 
 def read_srt(file_path):
     """
@@ -72,29 +74,9 @@ def read_srt(file_path):
     with open(file_path, 'r', encoding='utf-8-sig') as file:
         content = file.read()
     
-    # Split content into blocks separated by blank lines
-    blocks = re.split(r'\n\s*\n', content.strip(), flags=re.MULTILINE)
-    
-    for block in blocks:
-        lines = block.strip().split('\n')
-        if len(lines) >= 3:
-            try:
-                number = int(lines[0].strip())
-            except ValueError:
-                print(f"Warning: Invalid subtitle number '{lines[0]}' in file '{file_path}'. Skipping block.")
-                continue
-            
-            time_match = re.match(r'(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})', lines[1].strip())
-            if time_match:
-                start_time = parse_time(time_match.group(1))
-                end_time = parse_time(time_match.group(2))
-                if not start_time or not end_time:
-                    print(f"Warning: Invalid timecodes in subtitle number {number} in file '{file_path}'. Skipping block.")
-                    continue
-                text = ' '.join(lines[2:]).strip()
-                subtitles.append(Subtitle(number, start_time, end_time, text))
-            else:
-                print(f"Warning: Time format incorrect in subtitle number {number} in file '{file_path}'. Skipping block.")
+    for number, start_time, end_time, text in iter_srt_blocks(content, file_path):
+        subtitles.append(Subtitle(int(number), parse_time(start_time), parse_time(end_time),
+                                  text.replace('\n', ' ').strip()))
     return subtitles
 
 def write_csv(subtitles, csv_path):
@@ -139,18 +121,23 @@ def main():
     os.makedirs(output_directory, exist_ok=True)
     
     # Find all .srt files in the input directory
-    srt_files = [f for f in os.listdir(input_directory) if f.lower().endswith('.srt')]
+    srt_files = [entry.name for entry in os.scandir(input_directory) if entry.is_file() and entry.name.lower().endswith('.srt')]
     
     if not srt_files:
         print(f"No .srt files found in the '{input_subdir}' folder.")
         sys.exit(1)
     
+    jobs = []
     for srt_file in srt_files:
         srt_path = os.path.join(input_directory, srt_file)
         base_name, _ = os.path.splitext(srt_file)
         csv_file_name = f"{base_name}.csv"
         csv_path = os.path.join(output_directory, csv_file_name)
-        process_srt_file(srt_path, csv_path)
+        jobs.append((srt_path, csv_path))
+    
+    # Each file is independent, so convert them on all available cores
+    with multiprocessing.Pool(min(multiprocessing.cpu_count(), len(jobs))) as pool:
+        pool.starmap(process_srt_file, jobs, chunksize=1)
     
     print("All files have been successfully converted to CSV format.")
 
@@ -1,7 +1,11 @@
 import os
 import csv
 import argparse
+import functools
+import itertools
+import multiprocessing
 import sys
+import re
 import unicodedata
 import string
 from opencc import OpenCC
@@ -33,84 +37,116 @@ def parse_arguments():
     )
     return parser.parse_args()
 
-def is_ascii(char):
-    """
-    Determines if a character is an ASCII character.
-    
-    Parameters:
-        char (str): A single character string.
-    
-    Returns:
-        bool: True if the character is ASCII, False otherwise.
-    """
-    return ord(char) < 128
-    
-def is_full_width(char):
+# Full-width punctuation marks that should not have spaces inserted
+FULL_WIDTH_PUNCTUATIONS = frozenset({
+    '。', '，', '！', '？', '：', '；', '“', '”', '‘', '’', '（', '）', '「', '」', '『', '』', '《', '》',
+    '、', '—', '…', '～', '·', '〈', '〉', '﹏', '｛', '｝', '［', '］', '【', '】',
+    '﹐', '﹑', '﹒', '﹔', '﹖', '﹗', '﹕', '﹘', '﹝', '﹞', '﹟', '﹡',
+    '﹢', '﹣', '﹤', '﹥', '﹦', '﹩', '﹪', '﹫', '﹬', '﹭', '﹮', '﹯',
+})
+
+# ASCII whitespace and punctuation, plus the empty string standing for "no character"
+PUNCTUATION_SPACE_OR_NOTHING = frozenset(string.whitespace) | frozenset(string.punctuation) | {''}
+
+# Character class flags, one bit each, used by the lookup table below
+HALF_WIDTH = 1
+FULL_WIDTH = 2
+FULL_WIDTH_PUNCTUATION = 4
+PUNCTUATION_OR_SPACE = 8
+
+def build_char_flags():
     """
-    Determines if a character is full-width.
-    
-    Parameters:
-        char (str): A single character string.
-    
+    Computes the character class flags of every BMP code point: HALF_WIDTH for ASCII and half-width forms,
+    FULL_WIDTH for full-width, wide and ambiguous characters, FULL_WIDTH_PUNCTUATION for FULL_WIDTH_PUNCTUATIONS
+    and PUNCTUATION_OR_SPACE for ASCII whitespace and punctuation.
+
     Returns:
-        bool: True if the character is full-width, False otherwise.
+        bytes: A combination of HALF_WIDTH, FULL_WIDTH, FULL_WIDTH_PUNCTUATION and PUNCTUATION_OR_SPACE
+        per code point, indexed by ord(char).
     """
-    if len(char) != 1:
-        return False
-    east_asian_width = unicodedata.east_asian_width(char)
-    return east_asian_width in ('F', 'W', 'A')  # Full-width, Wide, Ambiguous
+    flags = bytearray(
+        FULL_WIDTH if width in ('F', 'W', 'A') else HALF_WIDTH if width == 'H' else 0
+        for width in map(unicodedata.east_asian_width, map(chr, range(0x10000)))
+    )
+    for code_point in range(128):
+        flags[code_point] |= HALF_WIDTH
+    for char in FULL_WIDTH_PUNCTUATIONS:
+        flags[ord(char)] |= FULL_WIDTH_PUNCTUATION
+    for char in PUNCTUATION_SPACE_OR_NOTHING - {''}:
+        flags[ord(char)] |= PUNCTUATION_OR_SPACE
+    return bytes(flags)
 
-def is_half_width(char):
+# Flags of every BMP code point, indexed by ord(char)
+CHAR_FLAGS = build_char_flags()
+
+def range_class(ranges):
     """
-    Determines if a character is half-width.
-    
+    Builds a regular expression character class matching the given ranges of code points.
+
     Parameters:
-        char (str): A single character string.
-    
+        ranges (iterable of (int, int)): Inclusive (first, last) code point ranges.
+
     Returns:
-        bool: True if the character is half-width, False otherwise.
+        str: A character class such as '[\\U00000041-\\U0000005a]'.
     """
-    if len(char) != 1:
-        return False
-    if is_ascii(char):
-        return True
-    east_asian_width = unicodedata.east_asian_width(char)
-    return east_asian_width == 'H'  # Half-width
+    return '[' + ''.join(f'\\U{first:08x}-\\U{last:08x}' for first, last in ranges) + ']'
 
-def is_full_width_punctuation(char):
+def selected_class(selected, offset=0):
     """
-    Checks if a character is a full-width punctuation mark that should not have spaces inserted.
-    
+    Builds a regular expression character class from a table of selected code points. Runs of them
+    are found with a bytes regex rather than one code point at a time.
+
     Parameters:
-        char (str): A single character string.
-    
+        selected (bytes): 1 for each selected code point, 0 otherwise.
+        offset (int): Code point of the first entry of the table.
+
     Returns:
-        bool: True if the character is a full-width punctuation mark, False otherwise.
+        str: A character class such as '[\\U00000041-\\U0000005a]'.
     """
-    full_width_punctuations = {
-        '。', '，', '！', '？', '：', '；', '“', '”', '‘', '’', '（', '）', '「', '」', '『', '』', '《', '》',
-        '、', '—', '…', '～', '·', '〈', '〉', '﹏', '｛', '｝', '［', '］', '【', '】',
-        '﹐', '﹑', '﹒', '﹔', '﹖', '﹗', '﹕', '﹘', '﹝', '﹞', '﹟', '﹡',
-        '﹢', '﹣', '﹤', '﹥', '﹦', '﹩', '﹪', '﹫', '﹬', '﹭', '﹮', '﹯',
-    }
-    return char in full_width_punctuations
+    return range_class((offset + run.start(), offset + run.end() - 1) for run in re.finditer(b'\x01+', selected))
 
-def is_punctuation_space_or_nothing(char):
+def flag_class(mask, value):
     """
-    Determines if a character is a space or punctuation.
-    
+    Builds a regular expression character class matching the BMP code points whose flags, restricted
+    to mask, equal value.
+
     Parameters:
-        char (str): A single character string.
-    
+        mask (int): Flags to look at.
+        value (int): Required value of those flags.
+
     Returns:
-        bool: True if the character is a space or punctuation, False otherwise.
+        str: A character class such as '[\\U00000041-\\U0000005a]'.
     """
-    return char in string.whitespace or char in string.punctuation or char == ''
+    return selected_class(CHAR_FLAGS.translate(bytes(flags & mask == value for flags in range(256))))
+
+# Half-width characters that are not punctuation or space (none exist above the BMP)
+HALF_WIDTH_CLASS = flag_class(HALF_WIDTH | PUNCTUATION_OR_SPACE, HALF_WIDTH)
+# Any half-width character, including punctuation and space
+ANY_HALF_WIDTH_RE = re.compile(flag_class(HALF_WIDTH, HALF_WIDTH))
+# Full-width code points of planes 1-3 (historic scripts, emoji, CJK extensions), read from unicodedata
+# like the BMP. Planes 4 and up hold nothing but tags, variation selectors and private use characters,
+# which are treated as not full-width.
+SUPPLEMENTARY_FULL_WIDTH_CLASS = selected_class(bytes(
+    width in ('F', 'W', 'A') for width in map(unicodedata.east_asian_width, map(chr, range(0x10000, 0x40000)))
+), offset=0x10000)
+# Full-width characters that are not punctuation or space (all punctuation lies within the BMP).
+# Code points above the BMP are only tested after a cheap range check, since their long list of
+# ranges would otherwise be scanned for every half-width character.
+FULL_WIDTH_CLASS = '(?:{}|(?=[\\U00010000-\\U0003ffff]){})'.format(
+    flag_class(FULL_WIDTH | FULL_WIDTH_PUNCTUATION | PUNCTUATION_OR_SPACE, FULL_WIDTH),
+    SUPPLEMENTARY_FULL_WIDTH_CLASS,
+)
+# Zero-width match at every position where a space should be inserted
+SPACE_BOUNDARY_RE = re.compile(
+    f'(?<={HALF_WIDTH_CLASS})(?={FULL_WIDTH_CLASS})|(?<={FULL_WIDTH_CLASS})(?={HALF_WIDTH_CLASS})'
+)
 
+@functools.lru_cache(maxsize=100_000)
 def sanitize_content(content, converter):
     """
     Converts Simplified Chinese to Traditional Chinese, then inserts spaces between adjacent half-width
     and full-width characters, excluding full-width punctuation marks.
+    Results are memoized, as subtitles often repeat short lines such as names and exclamations.
     
     Parameters:
         content (str): The subtitle content in Chinese.
@@ -125,22 +161,40 @@ def sanitize_content(content, converter):
     # Convert Simplified Chinese to Traditional Chinese
     traditional_content = converter.convert(content)
 
-    sanitized = []
-    prev_char = ''
-
-    for char in traditional_content:
-        if  not is_punctuation_space_or_nothing(prev_char) and not is_punctuation_space_or_nothing(char):
-            # Insert space if:
-            # 1. Previous char is half-width and current is full-width and not punctuation
-            # 2. Previous char is full-width (not punctuation) and current is half-width
-            if (is_half_width(prev_char) and is_full_width(char) and not is_full_width_punctuation(char)):
-                sanitized.append(' ')
-            elif (is_full_width(prev_char) and not is_full_width_punctuation(prev_char) and is_half_width(char)):
-                sanitized.append(' ')
-            sanitized.append(char)
-            prev_char = char
+    # Most lines are pure Chinese; without any half-width character there is nothing to change
+    if ANY_HALF_WIDTH_RE.search(traditional_content) is None:
+        return traditional_content
+
+    # Insert a space at every boundary between half-width and full-width (non-punctuation) characters
+    sanitized = SPACE_BOUNDARY_RE.sub(' ', traditional_content)
     # replace ": " with "："
-    return ''.join(sanitized).replace(": ", "：")
+    return sanitized.replace(": ", "：")
+
+def sanitize_rows(rows, field_count, content_index, converter):
+    """
+    Sanitizes the 'Content_zh' field of each row in place, yielding rows one at a time.
+    
+    Parameters:
+        rows (iterable of list): CSV rows without the header.
+        field_count (int): Number of fields in the header.
+        content_index (int): Index of the 'Content_zh' field.
+        converter (OpenCC): An instance of OpenCC for conversion.
+    
+    Yields:
+        list: The sanitized row.
+    """
+    for idx, row in enumerate(rows, start=1):
+        if len(row) > field_count:
+            raise ValueError(f"Row {idx} has more fields than the header")
+        row.extend([''] * (field_count - len(row)))  # Fill missing fields like csv.DictWriter
+        original_content = row[content_index]
+        sanitized_content = sanitize_content(original_content, converter)
+        row[content_index] = sanitized_content
+        if idx <= 3:  # Print first few changes for verification
+            print(f"Original: {original_content}")
+            print(f"Sanitized: {sanitized_content}")
+            print("---")
+        yield row
 
 def process_csv_file(input_path, output_path, converter):
     """
@@ -153,57 +207,72 @@ def process_csv_file(input_path, output_path, converter):
     """
     try:
         with open(input_path, 'r', encoding='utf-8-sig') as csv_infile:
-            reader = csv.DictReader(csv_infile)
-            fieldnames = reader.fieldnames
-            if 'Content_zh' not in fieldnames:
+            reader = csv.reader(csv_infile)
+            header = next(reader, None)
+            if header is None or 'Content_zh' not in header:
                 print(f"Warning: 'Content_zh' column not found in '{input_path}'. Skipping file.")
                 return
-            rows = list(reader)
-        
-        if not rows:
-            print(f"Warning: No data found in '{input_path}'. Skipping file.")
-            return
-        
-        # Sanitize 'Content_zh'
-        for idx, row in enumerate(rows, start=1):
-            original_content = row['Content_zh']
-            sanitized_content = sanitize_content(original_content, converter)
-            row['Content_zh'] = sanitized_content
-            if idx <= 3:  # Print first few changes for verification
-                print(f"Original: {original_content}")
-                print(f"Sanitized: {sanitized_content}")
-                print("---")
-        
-        # Write sanitized data to new CSV
-        with open(output_path, 'w', newline='', encoding='utf-8') as csv_outfile:
-            writer = csv.DictWriter(csv_outfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(rows)
+            content_index = header.index('Content_zh')
+            rows = (row for row in reader if row)  # Skip blank lines like csv.DictReader
+            first_row = next(rows, None)
+            if first_row is None:
+                print(f"Warning: No data found in '{input_path}'. Skipping file.")
+                return
+            
+            # Sanitize 'Content_zh' and write each row as soon as it is read
+            with open(output_path, 'w', newline='', encoding='utf-8') as csv_outfile:
+                writer = csv.writer(csv_outfile)
+                writer.writerow(header)
+                writer.writerows(sanitize_rows(itertools.chain([first_row], rows), len(header), content_index, converter))
         
         print(f"Successfully sanitized '{os.path.basename(input_path)}' and saved to '{os.path.basename(output_path)}'.\n")
     
     except Exception as e:
         print(f"Error processing '{input_path}': {e}")
 
-def convert_all_csv_sanitize(input_directory, output_directory, converter):
+# OpenCC converter of the current worker process, created by init_worker()
+worker_converter = None
+
+def init_worker(config):
+    """
+    Initializes a worker process with its own OpenCC converter, since converters cannot be pickled.
+    
+    Parameters:
+        config (str): The OpenCC configuration file, e.g. 's2twp.json'.
+    """
+    global worker_converter
+    worker_converter = OpenCC(config)
+
+def sanitize_csv_file(input_path, output_path):
+    """
+    Sanitizes a single CSV file using the converter of the current worker process.
+    
+    Parameters:
+        input_path (str): Path to the input CSV file.
+        output_path (str): Path to save the sanitized CSV file.
+    """
+    process_csv_file(input_path, output_path, worker_converter)
+
+def convert_all_csv_sanitize(input_directory, output_directory, config):
     """
-    Sanitizes all CSV files in the input directory and saves them to the output directory.
+    Sanitizes all CSV files in the input directory in parallel and saves them to the output directory.
     
     Parameters:
         input_directory (str): Directory containing input CSV files.
         output_directory (str): Directory to save sanitized CSV files.
-        converter (OpenCC): An instance of OpenCC for conversion.
+        config (str): The OpenCC configuration file used by every worker process.
     """
     # Ensure the output directory exists
     os.makedirs(output_directory, exist_ok=True)
     
     # List all CSV files in the input directory
-    csv_files = [f for f in os.listdir(input_directory) if f.lower().endswith('.csv')]
+    csv_files = [entry.name for entry in os.scandir(input_directory) if entry.is_file() and entry.name.lower().endswith('.csv')]
     
     if not csv_files:
         print(f"No CSV files found in the '{input_directory}' folder.")
         return
     
+    jobs = []
     for csv_file in csv_files:
         input_file_path = os.path.join(input_directory, csv_file)
         base_name, ext = os.path.splitext(csv_file)
@@ -211,7 +280,14 @@ def convert_all_csv_sanitize(input_directory, output_directory, converter):
         output_file_path = os.path.join(output_directory, output_file_name)
         
         print(f"Sanitizing '{csv_file}'...")
-        process_csv_file(input_file_path, output_file_path, converter)
+        jobs.append((input_file_path, output_file_path))
+    
+    # Each file is independent, so sanitize them on all available cores.
+    # Processes are used rather than threads: the OpenCC binding holds the GIL while converting,
+    # so converting rows on a thread pool would not run in parallel.
+    processes = min(multiprocessing.cpu_count(), len(jobs))
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(config,)) as pool:
+        pool.starmap(sanitize_csv_file, jobs, chunksize=1)
 
 def main():
     args = parse_arguments()
@@ -228,10 +304,8 @@ def main():
         print(f"Error: Input subdirectory '{input_subdir}' not found in '{main_directory}'.")
         sys.exit(1)
     
-    # Initialize OpenCC for Simplified to Traditional conversion
-    converter = OpenCC('s2twp.json')  # 's2t' stands for Simplified to Traditional
-    
-    convert_all_csv_sanitize(input_directory, output_directory, converter)
+    # Each worker initializes OpenCC for Simplified to Traditional conversion
+    convert_all_csv_sanitize(input_directory, output_directory, 's2twp.json')  # 's2t' stands for Simplified to Traditional
     print("All files have been successfully sanitized and saved.")
 
 if __name__ == "__main__":
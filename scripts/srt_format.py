@@ -0,0 +1,41 @@
+import re
+
+# A subtitle block starts the file or follows a blank line. A well-formed block has a number line,
+# a timecode line and text lines up to the next blank line; anything else is captured as 'malformed'
+# so it can be reported. The text is matched line by line rather than with a lazy '.*?', which would
+# test for a blank line after every character.
+SUBTITLE_BLOCK_RE = re.compile(
+    r'(?:\A|\n\s*\n)\s*(?:'
+    r'([+-]?\d+(?:_\d+)*)[^\S\n]*\n'
+    r'[^\S\n]*(\d{2}:\d{2}:\d{2},\d{3})[^\S\n]*-->[^\S\n]*(\d{2}:\d{2}:\d{2},\d{3})[^\n]*\n'
+    r'([^\S\n]*\S[^\n]*(?:\n[^\S\n]*\S[^\n]*)*)'
+    r'|(?P<malformed>[^\n]*(?:\n[^\S\n]*\S[^\n]*)*))'
+)
+
+def iter_srt_blocks(content, file_path):
+    """
+    Parses the blocks of an SRT file in one pass, warning about blocks with an invalid number or timecode.
+
+    Parameters:
+        content (str): Content of the SRT file.
+        file_path (str): Path of the SRT file, for the warnings.
+
+    Yields:
+        tuple: The number, start time, end time and text of each valid block, as strings.
+        The text keeps its line breaks.
+    """
+    for match in SUBTITLE_BLOCK_RE.finditer(content.strip()):
+        malformed = match.group('malformed')
+        if malformed is None:
+            yield match.group(1, 2, 3, 4)
+            continue
+        # Blocks of fewer than three lines were never subtitles and are skipped silently
+        lines = malformed.split('\n')
+        if len(lines) < 3:
+            continue
+        try:
+            number = int(lines[0].strip())
+        except ValueError:
+            print(f"Warning: Invalid subtitle number '{lines[0]}' in file '{file_path}'. Skipping block.")
+            continue
+        print(f"Warning: Time format incorrect in subtitle number {number} in file '{file_path}'. Skipping block.")
@@ -1,28 +1,38 @@
 import os
 import re
 import argparse
-from datetime import datetime
+import itertools
+import multiprocessing
 import sys
+from srt_format import iter_srt_blocks
 
 def parse_time(time_str):
     """
-    Parses a time string from SRT format to a datetime object.
-    Example: "00:01:15,123" -> datetime object
+    Parses a time string from SRT format to an integer number of milliseconds.
+    Example: "00:01:15,123" -> 75123
     """
-    return datetime.strptime(time_str, "%H:%M:%S,%f")
+    return (int(time_str[0:2]) * 3600000 + int(time_str[3:5]) * 60000
+            + int(time_str[6:8]) * 1000 + int(time_str[9:12]))
 
-def format_time(time_obj):
+def format_time(milliseconds):
     """
-    Formats a datetime object to SRT time string.
-    Example: datetime object -> "00:01:15,123"
+    Formats an integer number of milliseconds to SRT time string.
+    Example: 75123 -> "00:01:15,123"
     """
-    return time_obj.strftime("%H:%M:%S,%f")[:-3]
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+
+WHITESPACE_RE = re.compile(r'\s+')
 
 class Subtitle:
+    __slots__ = ('number', 'start', 'end', 'text')
+
     def __init__(self, number, start, end, text):
         self.number = number  # int
-        self.start = start    # datetime
-        self.end = end        # datetime
+        self.start = start    # int, milliseconds
+        self.end = end        # int, milliseconds
         self.text = text      # list of strings
 
     def __str__(self):
@@ -38,62 +48,37 @@ def read_srt(file_path):
     with open(file_path, 'r', encoding='utf-8-sig') as f:
         content = f.read()
 
-    blocks = re.split(r'\n\s*\n', content.strip(), flags=re.MULTILINE)
-    for block in blocks:
-        lines = block.split('\n')
-        if len(lines) >= 3:
-            try:
-                number = int(lines[0].strip())
-            except ValueError:
-                print(f"Warning: Subtitle number expected, got '{lines[0]}' in file '{file_path}'. Skipping block.")
-                continue
-            time_match = re.match(r'(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})', lines[1].strip())
-            if time_match:
-                start_time = parse_time(time_match.group(1))
-                end_time = parse_time(time_match.group(2))
-                text = lines[2:]
-                subtitles.append(Subtitle(number, start_time, end_time, text))
-            else:
-                print(f"Warning: Time format incorrect in block {number} of file '{file_path}'.")
+    for number, start_time, end_time, text in iter_srt_blocks(content, file_path):
+        subtitles.append(Subtitle(int(number), parse_time(start_time), parse_time(end_time), text.split('\n')))
     return subtitles
 
 def write_srt(subtitles, file_path):
     """
     Writes a list of Subtitle objects to an SRT file.
     """
+    # Build the whole file first so it is written with a single call;
+    # SRT files separate blocks with a blank line
+    output = ''.join(f"{subtitle}\n" for subtitle in subtitles)
     with open(file_path, 'w', encoding='utf-8') as f:
-        for subtitle in subtitles:
-            f.write(str(subtitle))
-            f.write('\n')  # SRT files separate blocks with a blank line
+        f.write(output)
 
-def trim_extra_spaces(subtitles):
+def trim_extra_spaces(lines):
     """
-    Trims extra spaces from each line of subtitle text.
+    Trims extra spaces from the lines of one subtitle.
     - Removes leading and trailing spaces.
     - Replaces multiple consecutive spaces with a single space.
-    - Optionally removes blank lines within subtitles.
+    - Removes blank lines within the subtitle.
     """
-    for subtitle in subtitles:
-        trimmed_text = []
-        for line in subtitle.text:
-            # Remove leading and trailing spaces
-            line = line.strip()
-            # Replace multiple spaces with a single space
-            line = re.sub(r'\s+', ' ', line)
-            if line:  # Avoid adding empty lines
-                trimmed_text.append(line)
-        subtitle.text = trimmed_text
-    return subtitles
+    trimmed_lines = (WHITESPACE_RE.sub(' ', line.strip()) for line in lines)
+    return [line for line in trimmed_lines if line]
 
-def merge_two_line_subtitles(subtitles):
+def merge_two_lines(lines):
     """
-    Merges subtitles that have exactly two lines into one line.
+    Merges the lines of one subtitle into one line if it has exactly two lines.
     """
-    for subtitle in subtitles:
-        if len(subtitle.text) == 2:
-            merged_text = ' '.join(subtitle.text)
-            subtitle.text = [merged_text]
-    return subtitles
+    if len(lines) == 2:
+        return [' '.join(lines)]
+    return lines
 
 def has_punctuation(text):
     """
@@ -105,62 +90,37 @@ def has_punctuation(text):
         return False
     return text[-1] in punctuation
 
-def merge_subtitles_without_punctuation(subtitles):
-    """
-    Merges subtitles that end without punctuation with the next subtitle.
-    Adjusts the timing accordingly.
-    """
-    merged_subtitles = []
-    i = 0
-    while i < len(subtitles):
-        current = subtitles[i]
-        # Check if current subtitle's last line ends with punctuation
-        if has_punctuation(current.text[-1]):
-            merged_subtitles.append(current)
-            i += 1
-        else:
-            # Needs to merge with next subtitle if possible
-            if i + 1 < len(subtitles):
-                next_sub = subtitles[i + 1]
-                # Merge current and next
-                merged_text = ' '.join(current.text + next_sub.text)
-                merged_start = current.start
-                merged_end = next_sub.end
-                merged_subtitle = Subtitle(
-                    number=0,  # Temporary, will renumber later
-                    start=merged_start,
-                    end=merged_end,
-                    text=[merged_text]
-                )
-                merged_subtitles.append(merged_subtitle)
-                i += 2  # Skip the next subtitle as it's merged
-            else:
-                # Last subtitle without punctuation, cannot merge
-                merged_subtitles.append(current)
-                i += 1
-    return merged_subtitles
-
-def renumber_subtitles(subtitles):
-    """
-    Renumbers subtitles sequentially starting from 1.
-    """
-    for idx, subtitle in enumerate(subtitles, start=1):
-        subtitle.number = idx
-    return subtitles
-
 def clean_subtitles(subtitles):
     """
-    Performs all cleaning steps on the subtitles:
+    Performs all cleaning steps on the subtitles in a single pass:
     1. Trims extra spaces.
     2. Merges two-line subtitles.
-    3. Merges subtitles without proper punctuation.
-    4. Renumbers subtitles.
+    3. Merges subtitles without proper punctuation with the next subtitle, adjusting the timing.
+    4. Renumbers subtitles sequentially starting from 1.
     """
-    subtitles = trim_extra_spaces(subtitles)
-    subtitles = merge_two_line_subtitles(subtitles)
-    subtitles = merge_subtitles_without_punctuation(subtitles)
-    subtitles = renumber_subtitles(subtitles)
-    return subtitles
+    cleaned_subtitles = []
+    pending = None  # Subtitle without punctuation, waiting to be merged with the next one
+    for subtitle in subtitles:
+        subtitle.text = merge_two_lines(trim_extra_spaces(subtitle.text))
+        if pending is not None:
+            # Merge pending and current, joining their lines once
+            cleaned_subtitles.append(Subtitle(
+                number=len(cleaned_subtitles) + 1,
+                start=pending.start,
+                end=subtitle.end,
+                text=[' '.join(itertools.chain(pending.text, subtitle.text))]
+            ))
+            pending = None
+        elif has_punctuation(subtitle.text[-1]):
+            subtitle.number = len(cleaned_subtitles) + 1
+            cleaned_subtitles.append(subtitle)
+        else:
+            pending = subtitle
+    if pending is not None:
+        # Last subtitle without punctuation, cannot merge
+        pending.number = len(cleaned_subtitles) + 1
+        cleaned_subtitles.append(pending)
+    return cleaned_subtitles
 
 def process_srt_file(input_path, output_path):
     """
@@ -220,18 +180,23 @@ def main():
     os.makedirs(preprocessed_subtitles_dir, exist_ok=True)
 
     # Find all .srt files in the input directory
-    srt_files = [f for f in os.listdir(raw_subtitles_dir) if f.lower().endswith('.srt')]
+    srt_files = [entry.name for entry in os.scandir(raw_subtitles_dir) if entry.is_file() and entry.name.lower().endswith('.srt')]
 
     if not srt_files:
         print(f"No .srt files found in the '{input_subdir}' folder.")
         sys.exit(1)
 
+    jobs = []
     for srt_file in srt_files:
         input_file_path = os.path.join(raw_subtitles_dir, srt_file)
         base_name, ext = os.path.splitext(srt_file)
         output_file_name = f"{base_name}_cleaned{ext}"
         output_file_path = os.path.join(preprocessed_subtitles_dir, output_file_name)
-        process_srt_file(input_file_path, output_file_path)
+        jobs.append((input_file_path, output_file_path))
+
+    # Each file is independent, so process them on all available cores
+    with multiprocessing.Pool(min(multiprocessing.cpu_count(), len(jobs))) as pool:
+        pool.starmap(process_srt_file, jobs, chunksize=1)
 
     print("All files processed successfully.")
 
@@ -1,18 +1,63 @@
 import os
 import csv
 import argparse
+import asyncio
+import collections
+import hashlib
+import itertools
+import json
+import aiohttp
 import openai
+import random
+import sqlite3
 import sys
+import tiktoken
 import time
 import re
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+CHAT_COMPLETIONS_URL = "https://api.openai.com/v1/chat/completions"
+DEFAULT_MODEL = "gpt-4o-mini"
+FALLBACK_ENCODING = "o200k_base"  # for models tiktoken doesn't know yet
+TOKENS_PER_SUBTITLE = 4  # quotes, comma and newline around each subtitle in the JSON lists
+OUTPUT_TOKEN_RATIO = 1.5  # Chinese translations take somewhat more tokens than the English
+MAX_RETRY_DELAY = 32  # seconds
+# Identical in every request, so the server can reuse its cached prefix across chunks
+SYSTEM_MESSAGE = (
+    "You are a highly skilled translator specializing in translating English content to Traditional Chinese "
+    "for Taiwanese audiences, especially in the context of game development documentaries."
+)
+PROMPT_PREAMBLE = (
+    "You are a proficient translator working on a documentary about game development by Double Fine studio. "
+    "Translate the following English subtitles to Traditional Chinese suitable for a Taiwanese audience. "
+    "Ensure that all translated terminologies comply with Taiwan's usage and avoid using any China-specific terminologies. "
+    "Reply with exactly one translation per subtitle, in the same order.\n\n"
+)
+# Structured output: the translations come back as a JSON array instead of numbered lines
+TRANSLATION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "subtitle_translations",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "translations": {"type": "array", "items": {"type": "string"}}
+            },
+            "required": ["translations"],
+            "additionalProperties": False
+        }
+    }
+}
+RATE_LIMIT_RESET_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+RATE_LIMIT_RESET_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
 
 def parse_arguments():
     """
     Parses command-line arguments.
     """
     parser = argparse.ArgumentParser(
-        description="Translate the 'Content' column of CSV files to Traditional Chinese using OpenAI GPT-4 API."
+        description="Translate the 'Content' column of CSV files to Traditional Chinese using the OpenAI API."
     )
     parser.add_argument(
         '-p', '--path',
@@ -38,6 +83,87 @@ def parse_arguments():
         default=None,
         help="Your OpenAI API key. If not provided, the script will look for the 'OPENAI_API_KEY' environment variable."
     )
+    parser.add_argument(
+        '-m', '--model',
+        type=str,
+        default=DEFAULT_MODEL,
+        help=f"OpenAI chat model used for translation; it must support structured outputs (default: '{DEFAULT_MODEL}')."
+    )
+    parser.add_argument(
+        '--chunk_size',
+        type=int,
+        default=100,
+        help="Maximum number of subtitles translated per request (default: 100)."
+    )
+    parser.add_argument(
+        '--max_input_tokens',
+        type=int,
+        default=4000,
+        help="Maximum estimated prompt tokens per request; fewer subtitles are packed into a request if needed (default: 4000)."
+    )
+    parser.add_argument(
+        '--max_output_tokens',
+        type=int,
+        default=8000,
+        help="Maximum estimated completion tokens per request; fewer subtitles are packed into a request if needed (default: 8000)."
+    )
+    parser.add_argument(
+        '--cache_path',
+        type=str,
+        default=None,
+        help="SQLite file caching translations between runs (default: 'translation_cache.sqlite' in the main directory)."
+    )
+    parser.add_argument(
+        '--manifest_path',
+        type=str,
+        default=None,
+        help="JSONL file every translated row is appended to (default: 'manifest.jsonl' in the main directory)."
+    )
+    parser.add_argument(
+        '--rebuild',
+        action='store_true',
+        help="Write the translated CSVs from the manifest and the input files, without calling the API."
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=8,
+        help="Maximum number of translation requests in flight at once (default: 8)."
+    )
+    parser.add_argument(
+        '--rpm',
+        type=int,
+        default=None,
+        help="Requests-per-minute quota of the account; requests are paced to stay under it (default: no limit)."
+    )
+    parser.add_argument(
+        '--tpm',
+        type=int,
+        default=None,
+        help="Tokens-per-minute quota of the account; requests are paced to stay under it (default: no limit)."
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help="Translate every file, even those whose output already holds a complete translation."
+    )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help="Submit all chunks of all files as a single OpenAI Batch API job (half the cost, finishes within 24 hours) instead of translating chunk by chunk."
+    )
+    parser.add_argument(
+        '--batch_id',
+        type=str,
+        default=None,
+        help="Collect the results of a Batch API job submitted by an earlier, interrupted '--batch' run instead of submitting a new one. Use the same files and options as that run."
+    )
+    parser.add_argument(
+        '--poll_interval',
+        type=int,
+        default=60,
+        help="Seconds to wait between status checks of a Batch API job (default: 60)."
+    )
     return parser.parse_args()
 
 def initialize_openai(api_key: str):
@@ -56,45 +182,351 @@ def construct_translation_prompt(subtitles: List[str]) -> str:
     Returns:
         str: The constructed prompt.
     """
-    prompt = (
-        "You are a proficient translator working on a documentary about game development by Double Fine studio. "
-        "Translate the following English subtitles to Traditional Chinese suitable for a Taiwanese audience. "
-        "Ensure that all translated terminologies comply with Taiwan's usage and avoid using any China-specific terminologies. "
-        "Maintain the numbering and formatting as shown.\n\n"
-    )
-    for idx, subtitle in enumerate(subtitles, start=1):
-        # Escape any quotes in subtitles to prevent prompt formatting issues
-        clean_subtitle = subtitle.replace('"', '\\"')
-        prompt += f"{idx}. \"{clean_subtitle}\"\n"
-    prompt += "\nProvide the translations in the same numbered format.\n\nTranslated Subtitles:\n"
-    return prompt
+    return PROMPT_PREAMBLE + json.dumps(subtitles, ensure_ascii=False, indent=0)
 
-def parse_translation_response(response: str, expected_count: int) -> List[str]:
+def parse_translation_response(response: str) -> Optional[List[str]]:
     """
     Parses the API response to extract translated subtitles.
     
     Parameters:
-        response (str): The raw response from the API.
-        expected_count (int): The number of subtitles expected.
+        response (str): The raw response from the API, a JSON object following TRANSLATION_RESPONSE_FORMAT.
+    
+    Returns:
+        Optional[List[str]]: List of translated subtitles, or None if the response is malformed (e.g. truncated).
+    """
+    try:
+        translations = json.loads(response)['translations']
+    except (ValueError, KeyError, TypeError):
+        print("Warning: Could not parse the translations in the response.")
+        return None
+    if not isinstance(translations, list) or not all(isinstance(translation, str) for translation in translations):
+        print("Warning: Could not parse the translations in the response.")
+        return None
+    return translations
+
+def reply_content(message: dict) -> str:
+    """
+    Extracts the text of a chat completion message.
+    
+    Parameters:
+        message (dict): The 'message' of a Chat Completions choice.
+    
+    Returns:
+        str: The text of the reply, or an empty string (a malformed response) if the model refused.
+    """
+    # Refusals come back with a null content and the explanation in 'refusal'
+    if message.get('content') is None:
+        print(f"Warning: The model refused to translate the batch: {message.get('refusal')}")
+        return ""
+    return message['content'].strip()
+
+def build_chat_request(subtitles: List[str], model: str) -> dict:
+    """
+    Builds the Chat Completions request body that translates a batch of subtitles.
+    
+    Parameters:
+        subtitles (List[str]): List of subtitle texts in English.
+        model (str): The chat model to use.
+    
+    Returns:
+        dict: The request body, usable both directly and as a Batch API request.
+    """
+    return {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": SYSTEM_MESSAGE
+            },
+            {
+                "role": "user",
+                "content": construct_translation_prompt(subtitles)
+            }
+        ],
+        "response_format": TRANSLATION_RESPONSE_FORMAT,
+        "temperature": 0  # deterministic output
+    }
+
+def open_translation_cache(cache_path: str) -> sqlite3.Connection:
+    """
+    Opens the translation cache, creating it if needed.
+    
+    Parameters:
+        cache_path (str): Path to the SQLite file.
+    
+    Returns:
+        sqlite3.Connection: Connection to the cache.
+    """
+    cache = sqlite3.connect(cache_path)
+    cache.execute("CREATE TABLE IF NOT EXISTS kv (hash BLOB PRIMARY KEY, zh TEXT)")
+    return cache
+
+def request_signature(model: str) -> bytes:
+    """
+    Digests everything in a request besides the subtitles (model, prompts, parameters), so that
+    changing any of them invalidates the cached translations.
+    
+    Parameters:
+        model (str): The chat model to use.
+    
+    Returns:
+        bytes: The digest.
+    """
+    template = json.dumps(build_chat_request([], model), sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(template, digest_size=32).digest()
+
+def translation_cache_key(subtitle: str, signature: bytes) -> bytes:
+    """
+    Computes the cache key of a subtitle.
+    
+    Parameters:
+        subtitle (str): Subtitle text in English.
+        signature (bytes): Digest of the request template, see request_signature.
+    
+    Returns:
+        bytes: The cache key.
+    """
+    return hashlib.blake2b(subtitle.encode('utf-8'), digest_size=16, key=signature).digest()
+
+def lookup_cached_translations(cache: sqlite3.Connection, keys: List[bytes]) -> Dict[bytes, str]:
+    """
+    Looks up cached translations.
+    
+    Parameters:
+        cache (sqlite3.Connection): Connection to the cache.
+        keys (List[bytes]): Cache keys to look up.
+    
+    Returns:
+        Dict[bytes, str]: Cached translations keyed by cache key. Keys not in the cache are left out.
+    """
+    hits = {}
+    unique_keys = list(set(keys))
+    # Stay below SQLite's limit on the number of bound parameters
+    for i in range(0, len(unique_keys), 500):
+        batch = unique_keys[i:i + 500]
+        placeholders = ','.join('?' * len(batch))
+        hits.update(cache.execute(f"SELECT hash, zh FROM kv WHERE hash IN ({placeholders})", batch))
+    return hits
+
+def store_translations(cache: sqlite3.Connection, keys: List[bytes], translations: List[str]):
+    """
+    Stores translations in the cache. Empty translations are not stored.
+    
+    Parameters:
+        cache (sqlite3.Connection): Connection to the cache.
+        keys (List[bytes]): Cache keys of the subtitles.
+        translations (List[str]): Translations, in the same order as keys.
+    """
+    with cache:
+        cache.executemany(
+            "INSERT OR IGNORE INTO kv (hash, zh) VALUES (?, ?)",
+            [(key, translation) for key, translation in zip(keys, translations) if translation]
+        )
+
+def open_manifest(manifest_path: str):
+    """
+    Opens the manifest for appending, creating it if needed. It is line-buffered, so every record
+    reaches the file as soon as it is written.
+    
+    Parameters:
+        manifest_path (str): Path to the JSONL file.
+    
+    Returns:
+        The open manifest file.
+    """
+    return open(manifest_path, 'a', encoding='utf-8', buffering=1)
+
+def subtitle_hash(subtitle: str) -> str:
+    """
+    Digests a subtitle for the manifest. Unlike the cache key it depends on the text alone, so records
+    stay valid when the model or prompt changes.
+    
+    Parameters:
+        subtitle (str): Subtitle text in English.
+    
+    Returns:
+        str: The hex digest.
+    """
+    return hashlib.blake2b(subtitle.encode('utf-8'), digest_size=16).hexdigest()
+
+def record_translations(manifest, csv_file: str, first_row: int, subtitles: List[str], translations: List[str],
+                        model: str, signature: bytes):
+    """
+    Appends one line per translated row to the manifest. Rows with an empty translation are not recorded.
+    
+    Parameters:
+        manifest: The open manifest file, see open_manifest.
+        csv_file (str): Filename of the input CSV file.
+        first_row (int): Index of the first of these rows among the rows of the file, counting from 0.
+        subtitles (List[str]): Subtitle texts in English.
+        translations (List[str]): Translations, in the same order as subtitles.
+        model (str): The chat model used.
+        signature (bytes): Digest of the request template, see request_signature; recorded as the prompt version.
+    """
+    lines = []
+    for row_idx, (subtitle, translation) in enumerate(zip(subtitles, translations), start=first_row):
+        if translation:
+            lines.append(json.dumps({
+                "file": csv_file,
+                "row": row_idx,
+                "hash": subtitle_hash(subtitle),
+                "zh": translation,
+                "model": model,
+                "prompt": signature.hex()
+            }, ensure_ascii=False) + '\n')
+    manifest.writelines(lines)
+
+def load_manifest(manifest_path: str) -> Dict[Tuple[str, int], dict]:
+    """
+    Reads the manifest. When a row was recorded more than once, the latest record wins.
+    
+    Parameters:
+        manifest_path (str): Path to the JSONL file.
+    
+    Returns:
+        Dict[Tuple[str, int], dict]: Records keyed by filename and row index.
+    """
+    records = {}
+    with open(manifest_path, 'r', encoding='utf-8') as manifest:
+        for line_number, line in enumerate(manifest, start=1):
+            try:
+                record = json.loads(line)
+                records[(record['file'], record['row'])] = record
+            except (ValueError, KeyError, TypeError):
+                # A run killed mid-write can leave the last line truncated
+                print(f"Warning: Skipping malformed line {line_number} of '{manifest_path}'.")
+    return records
+
+def estimate_request_tokens(request: dict) -> int:
+    """
+    Roughly estimates the prompt tokens of a request, at about four characters per token.
+    
+    Parameters:
+        request (dict): The request body.
+    
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return sum(len(message['content']) for message in request['messages']) // 4 + 1
+
+class RateLimiter:
+    """
+    Paces requests to stay under a requests-per-minute and a tokens-per-minute quota. Each quota is a
+    token bucket holding at most one minute's worth, refilled continuously as time passes.
+    Must be created inside the running event loop.
+    """
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.capacities = (rpm, tpm)
+        self.levels = [rpm or 0, tpm or 0]
+        self.updated = time.monotonic()
+        # Waiters are served in order, so a large request can't be starved by small ones
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self, tokens: int):
+        """
+        Waits until one request of the given number of tokens fits in both quotas, then debits it.
+        
+        Parameters:
+            tokens (int): Estimated tokens of the request.
+        """
+        if self.capacities == (None, None):
+            return
+        # A request larger than a whole bucket would never fit, so it only waits for a full bucket
+        costs = [min(cost, capacity) if capacity else 0 for cost, capacity in zip((1, tokens), self.capacities)]
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                elapsed = now - self.updated
+                self.updated = now
+                wait_time = 0.0
+                for i, capacity in enumerate(self.capacities):
+                    if capacity:
+                        self.levels[i] = min(capacity, self.levels[i] + elapsed * capacity / 60)
+                        wait_time = max(wait_time, (costs[i] - self.levels[i]) * 60 / capacity)
+                if wait_time <= 0:
+                    for i, cost in enumerate(costs):
+                        self.levels[i] -= cost
+                    return
+                await asyncio.sleep(wait_time)
+
+async def post_chat(session: aiohttp.ClientSession, payload: dict) -> dict:
+    """
+    Posts a Chat Completions request directly to the OpenAI API.
+    
+    Parameters:
+        session (aiohttp.ClientSession): Session carrying the authorization header.
+        payload (dict): The request body.
+    
+    Returns:
+        dict: The decoded response body.
+    """
+    async with session.post(CHAT_COMPLETIONS_URL, json=payload) as response:
+        if response.status != 200:
+            raise aiohttp.ClientResponseError(
+                response.request_info,
+                response.history,
+                status=response.status,
+                message=await response.text(),
+                headers=response.headers
+            )
+        return await response.json()
+
+def parse_retry_after(headers) -> Optional[float]:
+    """
+    Reads how long the server asked us to wait from the 'Retry-After' header, falling back to the
+    longer of the 'x-ratelimit-reset-*' headers (formatted like '1s', '6m0s' or '20ms').
+    
+    Parameters:
+        headers: Headers of the failed response, or None.
     
     Returns:
-        List[str]: List of translated subtitles.
+        Optional[float]: The delay in seconds, or None if the headers don't say.
     """
-    # Extract numbered translations using regex
-    pattern = re.compile(r'^\d+\.\s*"(.*?)"', re.MULTILINE)
-    matches = pattern.findall(response)
+    if not headers:
+        return None
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass  # HTTP-date form, not used by OpenAI
+    resets = []
+    for name in ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens'):
+        value = headers.get(name)
+        if value:
+            resets.append(sum(float(amount) * RATE_LIMIT_RESET_UNITS[unit]
+                              for amount, unit in RATE_LIMIT_RESET_RE.findall(value)))
+    return max(resets) if resets else None
+
+def retry_delay(attempt: int, backoff_factor: int = 2, retry_after: Optional[float] = None) -> float:
+    """
+    Computes how long to wait before retrying: exponential back-off, at least as long as the server
+    asked for, capped at MAX_RETRY_DELAY. Random jitter keeps concurrent requests that failed together
+    from retrying in lockstep.
     
-    if len(matches) != expected_count:
-        print(f"Warning: Expected {expected_count} translations but got {len(matches)}.")
+    Parameters:
+        attempt (int): Number of the attempt that failed, starting at 1.
+        backoff_factor (int): Factor by which the delay increases after each failed attempt.
+        retry_after (Optional[float]): Delay requested by the server, if any.
     
-    return matches
+    Returns:
+        float: The delay in seconds.
+    """
+    delay = max(retry_after or 0, backoff_factor ** attempt)
+    return min(MAX_RETRY_DELAY, delay) + random.uniform(0, 0.5)
 
-def translate_batch(subtitles: List[str], max_retries: int = 5, backoff_factor: int = 2) -> List[str]:
+async def translate_batch(session: aiohttp.ClientSession, subtitles: List[str], semaphore: asyncio.Semaphore,
+                          rate_limiter: RateLimiter, model: str, max_retries: int = 5,
+                          backoff_factor: int = 2) -> List[str]:
     """
-    Translates a batch of subtitles to Traditional Chinese using OpenAI's GPT-4 API.
+    Translates a batch of subtitles to Traditional Chinese using the OpenAI API.
     
     Parameters:
+        session (aiohttp.ClientSession): Session shared by all requests.
         subtitles (List[str]): List of subtitle texts in English.
+        semaphore (asyncio.Semaphore): Limits the number of requests in flight across all batches.
+        rate_limiter (RateLimiter): Paces requests across all batches.
+        model (str): The chat model to use.
         max_retries (int): Maximum number of retries for failed API calls.
         backoff_factor (int): Factor by which the delay increases after each failed attempt.
     
@@ -104,121 +536,620 @@ def translate_batch(subtitles: List[str], max_retries: int = 5, backoff_factor:
     if not subtitles:
         return []
     
-    prompt = construct_translation_prompt(subtitles)
+    translation = await request_translation(session, subtitles, semaphore, rate_limiter, model, max_retries,
+                                            backoff_factor)
+    if translation is None:
+        print(f"Failed to translate batch after {max_retries} attempts. Returning empty translations.")
+        return [""] * len(subtitles)
+    
+    translations = parse_translation_response(translation)
+    if translations is not None and len(translations) == len(subtitles):
+        return translations
+    
+    if len(subtitles) == 1:
+        # A lone subtitle split over several entries is still its translation
+        print("Warning: Expected 1 translation but got a malformed response.")
+        return ["".join(translations or [])]
+    
+    # Without numbering there is no telling which translations are missing, so retry the batch in halves;
+    # each retry is smaller than this batch, so this ends at single subtitles
+    got = "a malformed response" if translations is None else f"{len(translations)}"
+    print(f"Warning: Expected {len(subtitles)} translations but got {got}. Retrying in smaller batches...")
+    half = (len(subtitles) + 1) // 2
+    first, second = await asyncio.gather(
+        translate_batch(session, subtitles[:half], semaphore, rate_limiter, model, max_retries, backoff_factor),
+        translate_batch(session, subtitles[half:], semaphore, rate_limiter, model, max_retries, backoff_factor)
+    )
+    return first + second
+
+async def request_translation(session: aiohttp.ClientSession, subtitles: List[str], semaphore: asyncio.Semaphore,
+                              rate_limiter: RateLimiter, model: str, max_retries: int = 5,
+                              backoff_factor: int = 2) -> Optional[str]:
+    """
+    Requests the translation of a batch of subtitles, retrying failed API calls.
+    
+    Parameters:
+        session (aiohttp.ClientSession): Session shared by all requests.
+        subtitles (List[str]): List of subtitle texts in English.
+        semaphore (asyncio.Semaphore): Limits the number of requests in flight across all batches.
+        rate_limiter (RateLimiter): Paces requests across all batches.
+        model (str): The chat model to use.
+        max_retries (int): Maximum number of retries for failed API calls.
+        backoff_factor (int): Factor by which the delay increases after each failed attempt.
+    
+    Returns:
+        Optional[str]: The raw translation returned by the API, or None if every attempt failed.
+    """
+    request = build_chat_request(subtitles, model)
+    estimated_tokens = estimate_request_tokens(request)
     
     for attempt in range(1, max_retries + 1):
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a highly skilled translator specializing in translating English content to Traditional Chinese "
-                            "for Taiwanese audiences, especially in the context of game development documentaries."
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0  # deterministic output
-            )
-            translation = response.choices[0].message['content'].strip()
-            translated_subtitles = parse_translation_response(translation, len(subtitles))
-            return translated_subtitles
-        except openai.error.RateLimitError:
-            wait_time = backoff_factor ** attempt
-            print(f"[Attempt {attempt}/{max_retries}] Rate limit exceeded. Retrying in {wait_time} seconds...")
-            time.sleep(wait_time)
-        except openai.error.OpenAIError as e:
-            wait_time = backoff_factor ** attempt
-            print(f"[Attempt {attempt}/{max_retries}] OpenAI API error: {e}. Retrying in {wait_time} seconds...")
-            time.sleep(wait_time)
+            await rate_limiter.acquire(estimated_tokens)
+            async with semaphore:
+                response = await post_chat(session, request)
+            return reply_content(response['choices'][0]['message'])
+        except aiohttp.ClientResponseError as e:
+            wait_time = retry_delay(attempt, backoff_factor, parse_retry_after(e.headers))
+            if e.status == 429:
+                print(f"[Attempt {attempt}/{max_retries}] Rate limit exceeded. Retrying in {wait_time:.1f} seconds...")
+            else:
+                print(f"[Attempt {attempt}/{max_retries}] OpenAI API error {e.status}: {e.message}. Retrying in {wait_time:.1f} seconds...")
+            await asyncio.sleep(wait_time)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            wait_time = retry_delay(attempt, backoff_factor)
+            print(f"[Attempt {attempt}/{max_retries}] Connection error: {e!r}. Retrying in {wait_time:.1f} seconds...")
+            await asyncio.sleep(wait_time)
+    
+    return None
+
+class ChunkPacker:
+    """
+    Packs subtitles into chunks of at most chunk_size subtitles whose estimated prompt and completion tokens
+    stay within budget, so that runs of long lines don't overflow a request while short lines share one.
+    """
+    def __init__(self, model: str, chunk_size: int = 100, max_input_tokens: int = 4000, max_output_tokens: int = 8000):
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding(FALLBACK_ENCODING)
+        self.chunk_size = chunk_size
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.base_tokens = self.count_tokens(SYSTEM_MESSAGE + PROMPT_PREAMBLE)
+    
+    def count_tokens(self, text: str) -> int:
+        """
+        Counts the tokens of a text, treating special-token markup as plain text.
+        
+        Parameters:
+            text (str): The text to count.
+        
+        Returns:
+            int: The number of tokens.
+        """
+        return len(self.encoding.encode(text, disallowed_special=()))
+    
+    def pack(self, items: Iterable[Any], subtitle_of: Callable[[Any], str]) -> Iterator[List[Any]]:
+        """
+        Groups items into chunks, lazily and in order. An item too large for any budget gets a chunk of its own.
+        
+        Parameters:
+            items (Iterable[Any]): The items to group, e.g. CSV rows.
+            subtitle_of (Callable[[Any], str]): Returns the subtitle text of an item.
+        
+        Yields:
+            List[Any]: The chunks.
+        """
+        chunk = []
+        input_tokens = self.base_tokens
+        output_tokens = 0
+        for item in items:
+            tokens = self.count_tokens(subtitle_of(item)) + TOKENS_PER_SUBTITLE
+            if chunk and (len(chunk) >= self.chunk_size
+                          or input_tokens + tokens > self.max_input_tokens
+                          or output_tokens + tokens * OUTPUT_TOKEN_RATIO > self.max_output_tokens):
+                yield chunk
+                chunk = []
+                input_tokens = self.base_tokens
+                output_tokens = 0
+            chunk.append(item)
+            input_tokens += tokens
+            output_tokens += tokens * OUTPUT_TOKEN_RATIO
+        if chunk:
+            yield chunk
+
+def pretranslated_file_name(csv_file: str) -> str:
+    """
+    Names the output file of an input CSV file.
+    
+    Parameters:
+        csv_file (str): Filename of the input CSV file.
+    
+    Returns:
+        str: Filename of the translated CSV file.
+    """
+    base_name, ext = os.path.splitext(csv_file)
+    return f"{base_name}_pretranslated{ext}"
+
+def normalize_rows(rows: Iterable[List[str]], field_count: int) -> Iterator[List[str]]:
+    """
+    Skips blank lines and fills missing trailing fields with empty strings, like csv.DictReader and csv.DictWriter.
+    
+    Parameters:
+        rows (Iterable[List[str]]): CSV rows without the header.
+        field_count (int): Number of fields in the header.
     
-    print(f"Failed to translate batch after {max_retries} attempts. Returning empty translations.")
-    return [""] * len(subtitles)
+    Yields:
+        List[str]: The rows, each with exactly field_count fields.
+    """
+    for idx, row in enumerate(rows, start=1):
+        if not row:
+            continue
+        if len(row) > field_count:
+            raise ValueError(f"Row {idx} has more fields than the header")
+        row.extend([''] * (field_count - len(row)))
+        yield row
 
-def split_into_chunks(lst: List[str], chunk_size: int = 50) -> List[List[str]]:
+def is_translation_complete(input_path: str, output_path: str) -> bool:
     """
-    Splits a list into smaller chunks.
+    Checks whether the output file already holds a complete translation of the input file: the same subtitles
+    in the same order, each non-empty one with a non-empty translation.
     
     Parameters:
-        lst (List[str]): The list to split.
-        chunk_size (int): The maximum size of each chunk.
+        input_path (str): Path to the input CSV file.
+        output_path (str): Path to the translated CSV file.
     
     Returns:
-        List[List[str]]: A list of chunks.
+        bool: True if the input file doesn't need translating again.
     """
-    return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
+    if not os.path.exists(output_path):
+        return False
+    try:
+        with open(input_path, 'r', encoding='utf-8') as infile, open(output_path, 'r', encoding='utf-8') as outfile:
+            input_reader = csv.reader(infile)
+            output_reader = csv.reader(outfile)
+            input_header = next(input_reader, None)
+            output_header = next(output_reader, None)
+            if not input_header or 'Content' not in input_header:
+                return False
+            if not output_header or 'Content' not in output_header or 'Content_zh' not in output_header:
+                return False
+            content_index = input_header.index('Content')
+            output_content_index = output_header.index('Content')
+            translation_index = output_header.index('Content_zh')
+            input_rows = normalize_rows(input_reader, len(input_header))
+            output_rows = normalize_rows(output_reader, len(output_header))
+            for input_row, output_row in itertools.zip_longest(input_rows, output_rows):
+                if input_row is None or output_row is None:
+                    return False
+                if input_row[content_index] != output_row[output_content_index]:
+                    return False
+                if input_row[content_index] and not output_row[translation_index]:
+                    return False
+    except (OSError, UnicodeDecodeError, ValueError, csv.Error):
+        return False
+    return True
 
-def process_csv_file(input_path: str, output_path: str, chunk_size: int = 50):
+def read_subtitle_rows(input_path: str) -> Optional[Tuple[List[str], int, List[List[str]]]]:
     """
-    Processes a single CSV file: reads all subtitles, translates them in batch, and writes to a new CSV file.
+    Reads the rows of a CSV file that has a 'Content' column.
     
     Parameters:
         input_path (str): Path to the input CSV file.
+    
+    Returns:
+        Optional[Tuple[List[str], int, List[List[str]]]]: The header, the index of the 'Content' column and the rows,
+        or None if the 'Content' column is missing.
+    """
+    with open(input_path, 'r', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader, None)
+        if header is None or 'Content' not in header:
+            print(f"Warning: 'Content' column not found in '{input_path}'. Skipping file.")
+            return None
+        return header, header.index('Content'), list(normalize_rows(reader, len(header)))
+
+def write_translated_csv(output_path: str, header: List[str], rows: List[List[str]], translated_subtitles: List[str]):
+    """
+    Writes the rows to a new CSV file with the translated subtitles added as a 'Content_zh' column.
+    
+    Parameters:
         output_path (str): Path to save the translated CSV file.
-        chunk_size (int): Number of subtitles to translate in each batch.
+        header (List[str]): Header of the input CSV file.
+        rows (List[List[str]]): Rows of the input CSV file.
+        translated_subtitles (List[str]): Translated subtitles, in the same order as rows.
     """
+    # Write next to the output and rename, so an interrupted run never leaves a truncated CSV behind
+    part_path = output_path + '.part'
+    with open(part_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header + ['Content_zh'])
+        writer.writerows(row + [translation] for row, translation in zip(rows, translated_subtitles))
+    os.replace(part_path, output_path)
+
+async def translate_chunk(session: aiohttp.ClientSession, subtitles: List[str], semaphore: asyncio.Semaphore,
+                          rate_limiter: RateLimiter, model: str, cache: sqlite3.Connection, signature: bytes,
+                          in_flight: Dict[bytes, asyncio.Future]) -> Tuple[List[str], int]:
+    """
+    Translates a chunk of subtitles and caches the results. Only subtitles that are neither cached nor already
+    being translated by another chunk are sent, each of them once.
+    
+    Parameters:
+        session (aiohttp.ClientSession): Session shared by all requests.
+        subtitles (List[str]): List of subtitle texts in English.
+        semaphore (asyncio.Semaphore): Limits the number of requests in flight across all chunks.
+        rate_limiter (RateLimiter): Paces requests across all chunks.
+        model (str): The chat model to use.
+        cache (sqlite3.Connection): Connection to the translation cache.
+        signature (bytes): Digest of the request template, see request_signature.
+        in_flight (Dict[bytes, asyncio.Future]): Translations sent by any chunk in this run, keyed by cache key.
+    
+    Returns:
+        Tuple[List[str], int]: Translations in the same order as subtitles, and how many came from the cache.
+    """
+    keys = [translation_cache_key(subtitle, signature) for subtitle in subtitles]
+    hits = lookup_cached_translations(cache, keys)
+    loop = asyncio.get_running_loop()
+    # Claim the subtitles nobody has sent yet; the rest are awaited from the chunks that did
+    claimed = {}
+    for key, subtitle in zip(keys, subtitles):
+        if key not in hits and key not in in_flight:
+            claimed[key] = subtitle
+            in_flight[key] = loop.create_future()
+    futures = {key: in_flight[key] for key in keys if key not in hits}
+    
+    translations = []
     try:
-        with open(input_path, 'r', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            if 'Content' not in reader.fieldnames:
+        translations = await translate_batch(session, list(claimed.values()), semaphore, rate_limiter, model)
+        store_translations(cache, list(claimed), translations)
+    finally:
+        # Resolve every claim even on failure, so chunks waiting on them don't hang
+        for key, translation in zip(claimed, itertools.chain(translations, itertools.repeat(""))):
+            if not in_flight[key].done():
+                in_flight[key].set_result(translation)
+            # Release failed claims, so a later chunk sends these subtitles again
+            if not translation:
+                del in_flight[key]
+    
+    # Shielded, so cancelling this chunk doesn't cancel the translation other chunks are waiting on
+    translated_subtitles = [hits[key] if key in hits else await asyncio.shield(futures[key]) for key in keys]
+    return translated_subtitles, sum(key in hits for key in keys)
+
+async def process_csv_file(session: aiohttp.ClientSession, input_path: str, output_path: str,
+                           semaphore: asyncio.Semaphore, rate_limiter: RateLimiter, model: str,
+                           cache: sqlite3.Connection, signature: bytes, in_flight: Dict[bytes, asyncio.Future],
+                           packer: ChunkPacker, manifest, window: int = 8):
+    """
+    Processes a single CSV file: reads the subtitles chunk by chunk, translates up to `window` chunks concurrently,
+    and writes each chunk to the new CSV file as soon as it and the chunks before it are done. Only the rows of
+    the chunks in the window are held in memory.
+    Subtitles found in the cache are not sent for translation. Each finished chunk is recorded in the manifest.
+    
+    Parameters:
+        session (aiohttp.ClientSession): Session shared by all requests.
+        input_path (str): Path to the input CSV file.
+        output_path (str): Path to save the translated CSV file.
+        semaphore (asyncio.Semaphore): Limits the number of requests in flight across all files.
+        rate_limiter (RateLimiter): Paces requests across all files.
+        model (str): The chat model to use.
+        cache (sqlite3.Connection): Connection to the translation cache.
+        signature (bytes): Digest of the request template, see request_signature.
+        in_flight (Dict[bytes, asyncio.Future]): Translations sent by any chunk in this run, keyed by cache key.
+        packer (ChunkPacker): Groups the subtitles into chunks.
+        manifest: The open manifest file, see open_manifest.
+        window (int): Maximum number of chunks of this file being translated at once.
+    """
+    try:
+        file_name = os.path.basename(input_path)
+        with open(input_path, 'r', encoding='utf-8') as infile:
+            reader = csv.reader(infile)
+            header = next(reader, None)
+            if header is None or 'Content' not in header:
                 print(f"Warning: 'Content' column not found in '{input_path}'. Skipping file.")
                 return
-            rows = list(reader)
+            content_index = header.index('Content')
+            chunks = packer.pack(normalize_rows(reader, len(header)), lambda row: row[content_index])
+            print(f"Translating '{file_name}'...")
+            
+            # Finished chunks are appended in order; the complete file replaces the output only at the end
+            part_path = output_path + '.part'
+            pending = collections.deque()
+            subtitle_count = cached_count = 0
+            try:
+                with open(part_path, 'w', newline='', encoding='utf-8') as outfile:
+                    writer = csv.writer(outfile)
+                    writer.writerow(header + ['Content_zh'])
+                    while True:
+                        # Read ahead only as far as the window allows
+                        while len(pending) < window:
+                            rows = next(chunks, None)
+                            if rows is None:
+                                break
+                            task = asyncio.ensure_future(translate_chunk(
+                                session, [row[content_index] for row in rows], semaphore, rate_limiter, model, cache,
+                                signature, in_flight
+                            ))
+                            pending.append((rows, task))
+                        if not pending:
+                            break
+                        rows, task = pending.popleft()
+                        translations, cached = await task
+                        record_translations(manifest, file_name, subtitle_count, [row[content_index] for row in rows],
+                                            translations, model, signature)
+                        writer.writerows(row + [translation] for row, translation in zip(rows, translations))
+                        outfile.flush()
+                        subtitle_count += len(rows)
+                        cached_count += cached
+            except BaseException:
+                # Includes cancellation on Ctrl+C; the translations received so far are cached, the partial file is of no use
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+            finally:
+                for _, task in pending:
+                    task.cancel()
         
-        subtitles = [row['Content'] for row in rows]
-        print(f"Translating '{os.path.basename(input_path)}' with {len(subtitles)} subtitles...")
-        
-        translated_subtitles = []
-        chunks = split_into_chunks(subtitles, chunk_size)
-        for idx, chunk in enumerate(chunks, start=1):
-            print(f"Translating chunk {idx}/{len(chunks)}...")
-            translations = translate_batch(chunk)
-            if len(translations) != len(chunk):
-                print(f"Warning: Mismatch in translations for chunk {idx}. Some translations may be missing.")
-            translated_subtitles.extend(translations)
-        
-        if not translated_subtitles:
-            print(f"Warning: No translations obtained for '{input_path}'. Skipping file.")
+        if not subtitle_count:
+            os.remove(part_path)
+            print(f"Warning: No subtitles found in '{input_path}'. Skipping file.")
             return
-        
-        # Add the translated subtitles to rows
-        for row, translation in zip(rows, translated_subtitles):
-            row['Content_zh'] = translation
-        
-        # Define fieldnames for the output CSV
-        fieldnames = reader.fieldnames + ['Content_zh']
-        
-        with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(rows)
-        
-        print(f"Saved translated CSV to '{os.path.basename(output_path)}'\n")
+        os.replace(part_path, output_path)
+        print(f"Saved translated CSV to '{os.path.basename(output_path)}' ({cached_count} of {subtitle_count} subtitles from cache)\n")
     
     except Exception as e:
         print(f"Error processing '{input_path}': {e}")
 
-def process_all_csv_files(csv_files: List[str], input_directory: str, output_directory: str, chunk_size: int = 50):
+async def process_all_csv_files(api_key: str, csv_files: List[str], input_directory: str,
+                                output_directory: str, cache: sqlite3.Connection, manifest,
+                                model: str = DEFAULT_MODEL, chunk_size: int = 100, max_input_tokens: int = 4000,
+                                max_output_tokens: int = 8000, concurrency: int = 8, rpm: Optional[int] = None, tpm: Optional[int] = None):
     """
-    Processes all CSV files by translating their contents.
+    Processes all CSV files concurrently by translating their contents.
     
     Parameters:
+        api_key (str): The OpenAI API key.
         csv_files (List[str]): List of CSV filenames to process.
         input_directory (str): Directory where input CSVs are located.
         output_directory (str): Directory to save translated CSVs.
-        chunk_size (int): Number of subtitles to translate in each batch.
+        cache (sqlite3.Connection): Connection to the translation cache.
+        manifest: The open manifest file, see open_manifest.
+        model (str): The chat model to use.
+        chunk_size (int): Maximum number of subtitles to translate in each batch.
+        max_input_tokens (int): Maximum estimated prompt tokens of each batch.
+        max_output_tokens (int): Maximum estimated completion tokens of each batch.
+        concurrency (int): Maximum number of requests in flight at once.
+        rpm (Optional[int]): Requests-per-minute quota, or None for no limit.
+        tpm (Optional[int]): Tokens-per-minute quota, or None for no limit.
+    """
+    # Shared by the chunks of all files, so the limit holds for the whole run
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiter = RateLimiter(rpm, tpm)
+    signature = request_signature(model)
+    in_flight = {}
+    packer = ChunkPacker(model, chunk_size, max_input_tokens, max_output_tokens)
+    # One session for the whole run so connections are reused; the semaphore does the limiting
+    connector = aiohttp.TCPConnector(limit=0)
+    headers = {"Authorization": f"Bearer {api_key}"}
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        tasks = []
+        for csv_file in csv_files:
+            input_file_path = os.path.join(input_directory, csv_file)
+            output_file_path = os.path.join(output_directory, pretranslated_file_name(csv_file))
+            tasks.append(process_csv_file(session, input_file_path, output_file_path, semaphore, rate_limiter, model,
+                                          cache, signature, in_flight, packer, manifest, window=concurrency))
+        await asyncio.gather(*tasks)
+
+def build_batch_jsonl(chunks: Dict[str, List[str]], model: str) -> bytes:
     """
+    Builds the input file of a Batch API job, with one Chat Completions request per chunk.
+    
+    Parameters:
+        chunks (Dict[str, List[str]]): Chunks of subtitles keyed by their custom_id.
+        model (str): The chat model to use.
+    
+    Returns:
+        bytes: The JSONL content of the input file.
+    """
+    lines = []
+    for custom_id, chunk in chunks.items():
+        lines.append(json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": build_chat_request(chunk, model)
+        }, ensure_ascii=False))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def run_translation_batch(chunks: Dict[str, List[str]], model: str, poll_interval: int = 60,
+                          batch_id: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Submits all chunks as a single Batch API job, waits for it to finish and collects the translations.
+    
+    Parameters:
+        chunks (Dict[str, List[str]]): Chunks of subtitles keyed by their custom_id.
+        model (str): The chat model to use.
+        poll_interval (int): Seconds to wait between status checks.
+        batch_id (Optional[str]): ID of an already submitted job for the same chunks to wait for instead.
+    
+    Returns:
+        Dict[str, List[str]]: Translated subtitles keyed by custom_id. Failed chunks are left out.
+    """
+    batch_input = build_batch_jsonl(chunks, model)
+    if batch_id:
+        batch = openai.batches.retrieve(batch_id)
+        # The custom_ids only route results correctly if the job was built from the same chunks
+        if openai.files.content(batch.input_file_id).content != batch_input:
+            print(f"Error: Batch '{batch_id}' was submitted for different files, options or cache contents. "
+                  "Re-run with the same ones, or without '--batch_id' to submit a new batch.")
+            sys.exit(1)
+        print(f"Resuming batch '{batch.id}' with {len(chunks)} requests.")
+    else:
+        input_file = openai.files.create(file=("batch_input.jsonl", batch_input), purpose="batch")
+        batch = openai.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        print(f"Submitted batch '{batch.id}' with {len(chunks)} requests.")
+    
+    try:
+        while batch.status not in ('completed', 'failed', 'expired', 'cancelled'):
+            time.sleep(poll_interval)
+            batch = openai.batches.retrieve(batch.id)
+            counts = batch.request_counts
+            progress = f" ({counts.completed + counts.failed}/{counts.total} requests done)" if counts else ""
+            print(f"Batch '{batch.id}' is {batch.status}{progress}...")
+    except KeyboardInterrupt:
+        print(f"Stopped waiting. Batch '{batch.id}' keeps running on OpenAI's side. Run again with "
+              f"'--batch_id {batch.id}' and the same files and options to collect its results, or cancel it there.")
+        raise
+    
+    if batch.status != 'completed':
+        print(f"Warning: Batch '{batch.id}' ended with status '{batch.status}'. Using whatever results are available.")
+    if batch.error_file_id:
+        print(f"Warning: Some requests failed. See error file '{batch.error_file_id}' for details.")
+    
+    # Expired batches may still have partial results
+    translations = {}
+    if batch.output_file_id:
+        for line in openai.files.content(batch.output_file_id).text.splitlines():
+            result = json.loads(line)
+            custom_id = result['custom_id']
+            response = result.get('response')
+            if not response or response['status_code'] != 200:
+                print(f"Warning: Request '{custom_id}' failed: {result.get('error')}")
+                continue
+            translation = reply_content(response['body']['choices'][0]['message'])
+            chunk_translations = parse_translation_response(translation)
+            if chunk_translations is None or len(chunk_translations) != len(chunks[custom_id]):
+                print(f"Warning: Request '{custom_id}' returned the wrong number of translations.")
+                continue
+            translations[custom_id] = chunk_translations
+    return translations
+
+def process_all_csv_files_batch(csv_files: List[str], input_directory: str, output_directory: str,
+                                cache: sqlite3.Connection, manifest, model: str = DEFAULT_MODEL, chunk_size: int = 100,
+                                max_input_tokens: int = 4000, max_output_tokens: int = 8000, poll_interval: int = 60,
+                                batch_id: Optional[str] = None):
+    """
+    Processes all CSV files with a single Batch API job: collects the chunks of every file, translates
+    them in one job, then routes the translations back by custom_id and writes the translated CSVs.
+    Subtitles found in the cache are not sent for translation, and repeated subtitles are sent only once.
+    
+    Parameters:
+        csv_files (List[str]): List of CSV filenames to process.
+        input_directory (str): Directory where input CSVs are located.
+        output_directory (str): Directory to save translated CSVs.
+        cache (sqlite3.Connection): Connection to the translation cache.
+        manifest: The open manifest file, see open_manifest.
+        model (str): The chat model to use.
+        chunk_size (int): Maximum number of subtitles to translate in each request.
+        max_input_tokens (int): Maximum estimated prompt tokens of each request.
+        max_output_tokens (int): Maximum estimated completion tokens of each request.
+        poll_interval (int): Seconds to wait between status checks.
+        batch_id (Optional[str]): ID of a job already submitted for these files to collect instead of submitting one.
+    """
+    signature = request_signature(model)
+    packer = ChunkPacker(model, chunk_size, max_input_tokens, max_output_tokens)
+    files = {}  # csv_file -> (header, rows, cache keys, cache hits)
+    chunks = {}
+    chunk_keys = {}
+    queued = set()
+    for csv_file in csv_files:
+        input_file_path = os.path.join(input_directory, csv_file)
+        try:
+            subtitle_rows = read_subtitle_rows(input_file_path)
+        except Exception as e:
+            print(f"Error processing '{input_file_path}': {e}")
+            continue
+        if subtitle_rows is None:
+            continue
+        header, content_index, rows = subtitle_rows
+        
+        subtitles = [row[content_index] for row in rows]
+        keys = [translation_cache_key(subtitle, signature) for subtitle in subtitles]
+        hits = lookup_cached_translations(cache, keys)
+        # Subtitles queued by an earlier file or row are only sent once
+        misses = {}
+        for key, subtitle in zip(keys, subtitles):
+            if key not in hits and key not in queued:
+                misses[key] = subtitle
+        queued.update(misses)
+        
+        for idx, chunk in enumerate(packer.pack(misses.items(), lambda item: item[1]), start=1):
+            custom_id = f"{csv_file}::{idx}"
+            chunks[custom_id] = [subtitle for _, subtitle in chunk]
+            chunk_keys[custom_id] = [key for key, _ in chunk]
+        files[csv_file] = (header, rows, keys, hits)
+    
+    translations = run_translation_batch(chunks, model, poll_interval, batch_id) if chunks else {}
+    
+    translated = {}  # cache key -> translation
+    for custom_id, keys in chunk_keys.items():
+        if custom_id not in translations:
+            print(f"Warning: No translations for chunk '{custom_id}'. Its subtitles are left empty.")
+            continue
+        store_translations(cache, keys, translations[custom_id])
+        translated.update(zip(keys, translations[custom_id]))
+    
+    for csv_file, (header, rows, keys, hits) in files.items():
+        translated_subtitles = [hits[key] if key in hits else translated.get(key, "") for key in keys]
+        content_index = header.index('Content')
+        record_translations(manifest, csv_file, 0, [row[content_index] for row in rows], translated_subtitles, model,
+                            signature)
+        
+        output_file_name = pretranslated_file_name(csv_file)
+        output_file_path = os.path.join(output_directory, output_file_name)
+        try:
+            write_translated_csv(output_file_path, header, rows, translated_subtitles)
+            print(f"Saved translated CSV to '{output_file_name}'")
+        except Exception as e:
+            print(f"Error writing '{output_file_path}': {e}")
+
+def rebuild_csv_files(csv_files: List[str], input_directory: str, output_directory: str, manifest_path: str):
+    """
+    Writes the translated CSVs from the manifest and the input files, without calling the API. A recorded
+    translation is only used if its row still holds the subtitle it was made for.
+    
+    Parameters:
+        csv_files (List[str]): List of CSV filenames to rebuild.
+        input_directory (str): Directory where input CSVs are located.
+        output_directory (str): Directory to save translated CSVs.
+        manifest_path (str): Path to the manifest.
+    """
+    records = load_manifest(manifest_path)
     for csv_file in csv_files:
         input_file_path = os.path.join(input_directory, csv_file)
-        base_name, ext = os.path.splitext(csv_file)
-        output_file_name = f"{base_name}_pretranslated{ext}"
+        try:
+            subtitle_rows = read_subtitle_rows(input_file_path)
+        except Exception as e:
+            print(f"Error processing '{input_file_path}': {e}")
+            continue
+        if subtitle_rows is None:
+            continue
+        header, content_index, rows = subtitle_rows
+        
+        translated_subtitles = []
+        for row_idx, row in enumerate(rows):
+            record = records.get((csv_file, row_idx))
+            translation = ""
+            if record is not None and subtitle_hash(row[content_index]) == record.get('hash'):
+                translation = record.get('zh', "")
+            translated_subtitles.append(translation)
+        
+        found = sum(bool(translation) for translation in translated_subtitles)
+        if not found:
+            # Don't replace an existing output with an untranslated one
+            print(f"Warning: No recorded translations for '{csv_file}'. Skipping file.")
+            continue
+        output_file_name = pretranslated_file_name(csv_file)
         output_file_path = os.path.join(output_directory, output_file_name)
-        process_csv_file(input_file_path, output_file_path, chunk_size)
+        try:
+            write_translated_csv(output_file_path, header, rows, translated_subtitles)
+            print(f"Rebuilt '{output_file_name}' ({found} of {len(rows)} subtitles translated)")
+        except Exception as e:
+            print(f"Error writing '{output_file_path}': {e}")
 
 def main():
     args = parse_arguments()
@@ -228,7 +1159,7 @@ def main():
         api_key = args.api_key
     else:
         api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
+        if not api_key and not args.rebuild:
             print("Error: OpenAI API key not provided. Use the '--api_key' argument or set the 'OPENAI_API_KEY' environment variable.")
             sys.exit(1)
     
@@ -248,14 +1179,64 @@ def main():
     os.makedirs(output_directory, exist_ok=True)
     
     # Find all .csv files in the input directory
-    csv_files = [f for f in os.listdir(input_directory) if f.lower().endswith('.csv')]
+    csv_files = [entry.name for entry in os.scandir(input_directory) if entry.is_file() and entry.name.lower().endswith('.csv')]
     
     if not csv_files:
         print(f"No .csv files found in the '{input_subdir}' folder.")
         sys.exit(1)
     
+    manifest_path = args.manifest_path or os.path.join(main_directory, 'manifest.jsonl')
+    if args.rebuild:
+        if not os.path.isfile(manifest_path):
+            print(f"Error: Manifest '{manifest_path}' not found.")
+            sys.exit(1)
+        rebuild_csv_files(csv_files, input_directory, output_directory, manifest_path)
+        return
+    
+    # Leave out files translated by an earlier run
+    if not args.force:
+        remaining_files = []
+        for csv_file in csv_files:
+            input_file_path = os.path.join(input_directory, csv_file)
+            output_file_path = os.path.join(output_directory, pretranslated_file_name(csv_file))
+            if is_translation_complete(input_file_path, output_file_path):
+                print(f"Skipping '{csv_file}': already translated. Use '--force' to translate it again.")
+            else:
+                remaining_files.append(csv_file)
+        csv_files = remaining_files
+        if not csv_files:
+            print("All files are already translated.")
+            return
+    
+    cache_path = args.cache_path or os.path.join(main_directory, 'translation_cache.sqlite')
+    cache = open_translation_cache(cache_path)
+    manifest = open_manifest(manifest_path)
+    
     # Process all CSV files
-    process_all_csv_files(csv_files, input_directory, output_directory)
+    try:
+        if args.batch or args.batch_id:
+            process_all_csv_files_batch(csv_files, input_directory, output_directory, cache, manifest, model=args.model,
+                                        chunk_size=args.chunk_size, max_input_tokens=args.max_input_tokens,
+                                        max_output_tokens=args.max_output_tokens, poll_interval=args.poll_interval,
+                                        batch_id=args.batch_id)
+        else:
+            asyncio.run(process_all_csv_files(api_key, csv_files, input_directory, output_directory, cache, manifest,
+                                              model=args.model, chunk_size=args.chunk_size,
+                                              max_input_tokens=args.max_input_tokens,
+                                              max_output_tokens=args.max_output_tokens,
+                                              concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm))
+    except KeyboardInterrupt:
+        if args.batch or args.batch_id:
+            # Batch results are only cached once the job is collected
+            print("Interrupted. Nothing from the batch has been cached yet; "
+                  "a re-run without '--batch_id' submits and pays for a new batch.")
+        else:
+            # asyncio.run has already cancelled the pending requests and retry sleeps
+            print("Interrupted. Translations received so far are cached; run the script again to resume.")
+        sys.exit(130)
+    finally:
+        manifest.close()
+        cache.close()
     
     print("All files have been successfully translated and saved.")
 